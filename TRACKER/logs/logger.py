@@ -3,15 +3,27 @@ Sistema de logging para o chat P2P.
 Registra todas as mensagens trocadas com timestamp.
 """
 
-from datetime import datetime
 from pathlib import Path
+from queue import Empty, SimpleQueue
+from threading import Event, Lock, Thread
+import atexit
 import os
+import time
 
 class Logger:
     """
     Classe responsável por registrar logs das mensagens do chat.
+    
+    As chamadas de log apenas enfileiram o registro; uma thread
+    consumidora formata e grava os registros em lotes, descarregando o
+    buffer em disco sempre que a fila esvazia.
     """
     
+    BUFFER_SIZE = 64 * 1024
+    BATCH_SIZE = 256
+    # Tempo máximo (em segundos) que flush() aguarda a thread consumidora
+    FLUSH_TIMEOUT = 5
+    
     def __init__(self, log_file: str = "TRACKER/logs/chat.log"):
         """
         Inicializa o logger.
@@ -20,9 +32,84 @@ class Logger:
             log_file: Caminho para o arquivo de log
         """
         self.log_file = log_file
+        self.__lock = Lock()
+        self._ts_cache = (0, b"")
+        self._q = SimpleQueue()
         
         # Garante que o diretório existe
         Path(os.path.dirname(log_file)).mkdir(parents=True, exist_ok=True)
+        
+        self._fh = self._open()
+        self._writer = Thread(target=self._consume, daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+    
+    def _open(self):
+        """Abre o arquivo de log em modo append com buffer."""
+        return open(self.log_file, "ab", buffering=self.BUFFER_SIZE)
+    
+    def _timestamp(self, now: float) -> bytes:
+        """
+        Retorna o timestamp formatado para o instante informado.
+        A formatação é refeita apenas quando muda o segundo.
+        """
+        now = int(now)
+        if now != self._ts_cache[0]:
+            formatted = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(now))
+            self._ts_cache = (now, formatted.encode('utf-8'))
+        return self._ts_cache[1]
+    
+    def _consume(self):
+        """
+        Laço da thread consumidora.
+        
+        Retira da fila até BATCH_SIZE registros de uma vez, grava todos com
+        uma única chamada e descarrega o buffer quando a fila fica vazia ou
+        quando alguém aguarda um flush. Um item None encerra a thread.
+        Um registro que não possa ser formatado é descartado sem derrubar
+        a thread.
+        """
+        while True:
+            item = self._q.get()
+            batch = []
+            waiters = []
+            stop = False
+            
+            while True:
+                if item is None:
+                    stop = True
+                    break
+                if isinstance(item, Event):
+                    waiters.append(item)
+                else:
+                    try:
+                        now, line = item
+                        batch.append(
+                            b"[" + self._timestamp(now) + b"] " +
+                            str(line).encode('utf-8') + b"\n"
+                        )
+                    except Exception as e:
+                        print(f"<SISTEMA>: Erro ao formatar log: {e}")
+                    if len(batch) >= self.BATCH_SIZE:
+                        break
+                try:
+                    item = self._q.get_nowait()
+                except Empty:
+                    break
+            
+            try:
+                with self.__lock:
+                    if batch:
+                        self._fh.writelines(batch)
+                    if waiters or stop or self._q.empty():
+                        self._fh.flush()
+            except Exception as e:
+                print(f"<SISTEMA>: Erro ao salvar log: {e}")
+            
+            for waiter in waiters:
+                waiter.set()
+            if stop:
+                return
     
     def log(self, msg: str):
         """
@@ -31,13 +118,7 @@ class Logger:
         Args:
             msg: Mensagem a ser registrada
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        try:
-            with open(self.log_file, "a", encoding='utf-8') as f:
-                f.write(f"[{timestamp}] {msg}\n")
-        except Exception as e:
-            print(f"<SISTEMA>: Erro ao salvar log: {e}")
+        self._q.put((time.time(), msg))
     
     def log_security_event(self, event_type: str, details: str):
         """
@@ -47,20 +128,37 @@ class Logger:
             event_type: Tipo do evento (AUTENTICAÇÃO, INTEGRIDADE, etc.)
             details: Detalhes do evento
         """
-        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        
-        try:
-            with open(self.log_file, "a", encoding='utf-8') as f:
-                f.write(f"[{timestamp}] [SEGURANÇA:{event_type}] {details}\n")
-        except Exception as e:
-            print(f"<SISTEMA>: Erro ao salvar log de segurança: {e}")
+        self._q.put((time.time(), f"[SEGURANÇA:{event_type}] {details}"))
+    
+    def flush(self):
+        """Aguarda a gravação dos registros pendentes e descarrega o buffer."""
+        if not self._writer.is_alive():
+            return
+        done = Event()
+        self._q.put(done)
+        # Com tempo limite: se a thread morrer, quem chama não trava
+        done.wait(self.FLUSH_TIMEOUT)
+    
+    def close(self):
+        """Grava os registros pendentes, encerra a thread e fecha o arquivo."""
+        if self._writer.is_alive():
+            self._q.put(None)
+            self._writer.join()
+        with self.__lock:
+            if not self._fh.closed:
+                self._fh.close()
     
     def clear_logs(self):
         """Limpa o arquivo de log."""
+        self.flush()
+        
         try:
-            if os.path.exists(self.log_file):
-                os.remove(self.log_file)
-                print("<SISTEMA>: Logs limpos com sucesso.")
+            with self.__lock:
+                self._fh.close()
+                if os.path.exists(self.log_file):
+                    os.remove(self.log_file)
+                self._fh = self._open()
+            print("<SISTEMA>: Logs limpos com sucesso.")
         except Exception as e:
             print(f"<SISTEMA>: Erro ao limpar logs: {e}")
     
@@ -74,6 +172,8 @@ class Logger:
         Returns:
             list: Lista com as linhas do log
         """
+        self.flush()
+        
         try:
             if not os.path.exists(self.log_file):
                 return []
@@ -90,4 +190,4 @@ class Logger:
             return []
 
 # Instância global do logger
-logger = Logger()
\ No newline at end of file
+logger = Logger()
@@ -4,22 +4,27 @@ Implementa criação, entrada e controle de acesso às salas.
 """
 
 import hashlib
+import hmac
 from threading import Thread
 from utils import obter_hostname, socket_to_tuple
 
+def hash_senha(senha: str) -> bytes:
+    """Calcula o hash SHA-256 (32 bytes) da senha de uma sala."""
+    return hashlib.sha256(senha.encode('utf-8')).digest()
+
 class Sala:
     """
     Representa uma sala de chat privada com senha e controle de membros.
     """
     
-    def __init__(self, nome: str, porta: int, senha_hash: str, criador: str):
+    def __init__(self, nome: str, porta: int, senha_hash: bytes, criador: str):
         """
         Inicializa uma sala de chat.
         
         Args:
             nome: Nome da sala
             porta: Porta de comunicação da sala
-            senha_hash: Hash SHA-256 da senha da sala
+            senha_hash: Hash SHA-256 da senha da sala (32 bytes)
             criador: Nome do usuário criador
         """
         self.nome = nome
@@ -27,7 +32,7 @@ class Sala:
         self.ip = obter_hostname(porta)
         self.senha_hash = senha_hash
         self.criador = criador
-        self.membros = []
+        self.membros: set[str] = set()
     
     def verificar_senha(self, senha: str) -> bool:
         """
@@ -39,7 +44,7 @@ class Sala:
         Returns:
             bool: True se a senha está correta
         """
-        return self.senha_hash == hashlib.sha256(senha.encode()).hexdigest()
+        return hmac.compare_digest(self.senha_hash, hash_senha(senha))
     
     def expulsar(self, solicitante: str, usuario: str) -> str:
         """
@@ -65,12 +70,41 @@ class Sala:
 class SalasDB:
     """
     Gerencia o conjunto de salas e a relação usuários ↔ salas.
+    Os membros de cada sala são a única fonte da relação; a sala de um
+    usuário é obtida a partir deles.
     """
     
     def __init__(self):
         """Inicializa o banco de dados de salas."""
         self.salas: dict[str, Sala] = {}
-        self.usuarios_sala: dict[str, str] = {}
+    
+    def sala_de(self, usuario: str) -> Sala:
+        """
+        Retorna a sala da qual o usuário é membro.
+        
+        Args:
+            usuario: Nome do usuário
+            
+        Returns:
+            Sala: Objeto da sala ou None se o usuário não estiver em nenhuma
+        """
+        for sala in self.salas.values():
+            if usuario in sala.membros:
+                return sala
+        return None
+    
+    def adicionar_membro(self, sala: Sala, usuario: str):
+        """
+        Adiciona o usuário à sala, removendo-o de qualquer outra sala.
+        
+        Args:
+            sala: Sala de destino
+            usuario: Nome do usuário
+        """
+        for outra in self.salas.values():
+            if outra is not sala:
+                outra.membros.discard(usuario)
+        sala.membros.add(usuario)
     
     def criar_sala_com_servidor(self, nome: str, porta: int, senha: str, criador: str) -> str:
         """
@@ -91,11 +125,10 @@ class SalasDB:
         if not senha:
             return "<SISTEMA>: É necessário definir uma senha para criar uma sala privada."
         
-        senha_hash = hashlib.sha256(senha.encode()).hexdigest()
+        senha_hash = hash_senha(senha)
         sala = Sala(nome, porta, senha_hash, criador)
         self.salas[nome] = sala
-        self.usuarios_sala[criador] = nome
-        sala.membros.append(criador)
+        self.adicionar_membro(sala, criador)
         
         # Importa localmente para evitar importação circular
         import client
@@ -132,8 +165,7 @@ class SalasDB:
             return "<SISTEMA>: Senha incorreta."
         
         if usuario not in sala.membros:
-            sala.membros.append(usuario)
-            self.usuarios_sala[usuario] = nome
+            self.adicionar_membro(sala, usuario)
             return f"<SISTEMA>: Você entrou na sala {nome}."
         
         return "<SISTEMA>: Você já está na sala."
@@ -148,17 +180,12 @@ class SalasDB:
         Returns:
             str: Mensagem de resultado
         """
-        if usuario not in self.usuarios_sala:
+        sala = self.sala_de(usuario)
+        if sala is None:
             return "<SISTEMA>: Você não está em nenhuma sala."
         
-        nome_sala = self.usuarios_sala[usuario]
-        sala = self.salas[nome_sala]
-        
-        if usuario in sala.membros:
-            sala.membros.remove(usuario)
-        
-        del self.usuarios_sala[usuario]
-        return f"<SISTEMA>: Você saiu da sala {nome_sala}."
+        sala.membros.discard(usuario)
+        return f"<SISTEMA>: Você saiu da sala {sala.nome}."
     
     def listar_salas(self) -> list[str]:
         """
@@ -213,18 +240,16 @@ def entrar_na_sala(e: str):
     try:
         # Fecha conexões anteriores antes de entrar na nova sala
         for peer in list(peersdb.peers):
-            if peer != f"{sala.ip}":
+            if peer != sala.ip:
                 client.cliente.disconnect(peer)
         
         # Conecta à sala
-        client.cliente.connect(socket_to_tuple(f"{sala.ip}"), obter_hostname(sala.porta))
+        client.cliente.connect(socket_to_tuple(sala.ip), sala.ip)
         
         # Registra o usuário na sala localmente
         from main import usuario
         
-        if str(usuario) not in sala.membros:
-            sala.membros.append(str(usuario))
-        salasdb.usuarios_sala[str(usuario)] = nome
+        salasdb.adicionar_membro(sala, str(usuario))
         
         print(f"<SISTEMA>: Você entrou na sala {nome}.")
         
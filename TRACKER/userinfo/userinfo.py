@@ -50,12 +50,12 @@ class User:
         # Garante que o diretório existe
         Path('TRACKER/userinfo').mkdir(parents=True, exist_ok=True)
         
-        if os.path.exists('TRACKER/userinfo/user.json'):
+        try:
             with open('TRACKER/userinfo/user.json', 'r') as file:
                 credentials = json.load(file)
             self.__name = credentials['username']
             self.__password = credentials['password']
-        else:
+        except FileNotFoundError:
             clear()
             print('=' * 70)
             print('           CHAT P2P SEGURO - PRIMEIRO ACESSO')
@@ -105,9 +105,6 @@ class User:
             'password': self.__password
         }
         
-        # Garante que o diretório existe
-        Path('TRACKER/userinfo').mkdir(parents=True, exist_ok=True)
-        
         with open('TRACKER/userinfo/user.json', 'w') as file:
             json.dump(credentials, file, indent=2)
     
@@ -3,22 +3,42 @@ Cliente seguro com suporte a mTLS e HMAC.
 """
 
 from socket import *
-from threading import Lock
+from threading import Lock, Thread
+from collections import deque
+import selectors
 import ssl
-import json
 from peersdb import peersdb
-from utils import tuple_to_socket, socket_to_tuple, peers_to_str
-from security import secure_manager
+from utils import (
+    tuple_to_socket, socket_to_tuple, peers_to_str, obter_cn, pack_frame, send_frame
+)
+from security import (
+    secure_manager, pack_key_exchange, recv_key_exchange, get_client_context
+)
+
+# Tempo máximo (em segundos) para o handshake TLS e a troca de chaves
+HANDSHAKE_TIMEOUT = 10
+
+# Tempo máximo (em segundos) para descarregar a fila de um peer ao desconectar
+SEND_TIMEOUT = 10
+
+# Limite de bytes pendentes por conexão; acima dele o peer é descartado
+MAX_PENDING_BYTES = 8 * 1024 * 1024
 
 class ClientException(Exception):
     """Exceção para erros do cliente."""
     pass
 
 class Connections:
-    """Gerencia conexões SSL/TLS."""
+    """
+    Gerencia conexões SSL/TLS.
+    
+    As conexões ficam em uma tupla imutável substituída a cada alteração
+    (copy-on-write): escritas usam o lock, leituras não precisam dele nem
+    de cópia.
+    """
     
     def __init__(self):
-        self.connections: set[ssl.SSLSocket] = set()
+        self.connections: tuple[ssl.SSLSocket, ...] = ()
         self.__lock = Lock()
     
     def __str__(self):
@@ -26,12 +46,140 @@ class Connections:
     
     def add(self, peer):
         with self.__lock:
-            self.connections.add(peer)
+            if peer not in self.connections:
+                self.connections = self.connections + (peer,)
     
     def remove(self, peer):
         with self.__lock:
-            if peer in self.connections:
-                self.connections.remove(peer)
+            self.connections = tuple(c for c in self.connections if c is not peer)
+
+
+class Outbox:
+    """
+    Envio não-bloqueante das mensagens para os peers.
+    
+    Cada envio é tentado imediatamente; o que não couber no buffer do
+    socket fica em uma fila por conexão, drenada por uma thread com
+    selectors quando o socket estiver pronto para escrita. Assim um peer
+    lento não atrasa a entrega para os demais. Um peer que deixe de ler
+    acumula no máximo MAX_PENDING_BYTES antes de ser descartado.
+    """
+    
+    def __init__(self, on_error):
+        """
+        Args:
+            on_error: Função chamada com a conexão quando um envio pendente falha
+        """
+        self.__on_error = on_error
+        self.__pending: dict[ssl.SSLSocket, deque] = {}
+        self.__pending_bytes: dict[ssl.SSLSocket, int] = {}
+        self.__lock = Lock()
+        self.__selector = selectors.DefaultSelector()
+        
+        # Par de sockets para acordar a thread quando houver nova fila
+        self.__wakeup_r, self.__wakeup_w = socketpair()
+        self.__wakeup_r.setblocking(False)
+        self.__selector.register(self.__wakeup_r, selectors.EVENT_READ)
+        
+        Thread(target=self._run, daemon=True).start()
+    
+    def register(self, conn: ssl.SSLSocket):
+        """Coloca uma conexão (já com handshake concluído) em modo não-bloqueante."""
+        conn.setblocking(False)
+    
+    def send(self, conn: ssl.SSLSocket, data: bytes):
+        """
+        Envia dados sem bloquear, enfileirando o que não puder ser enviado.
+        Levanta OSError se a conexão falhar ou se a fila exceder
+        MAX_PENDING_BYTES.
+        """
+        with self.__lock:
+            pending = self.__pending.get(conn)
+            if pending is not None:
+                # Preserva a ordem: já há dados aguardando este socket
+                total = self.__pending_bytes[conn] + len(data)
+                if total > MAX_PENDING_BYTES:
+                    self._forget(conn)
+                    raise ConnectionError('Peer não está lendo; fila de envio excedeu o limite')
+                pending.append(data)
+                self.__pending_bytes[conn] = total
+                return
+            
+            sent = self._try_send(conn, data)
+            if sent < len(data):
+                self.__pending[conn] = deque([data[sent:]])
+                self.__pending_bytes[conn] = len(data) - sent
+                self.__selector.register(conn, selectors.EVENT_WRITE)
+                self.__wakeup_w.send(b'\0')
+    
+    def flush(self, conn: ssl.SSLSocket):
+        """
+        Volta a conexão ao modo bloqueante (com SEND_TIMEOUT) e envia o que
+        estiver pendente. Levanta OSError (TimeoutError) se o peer não ler.
+        """
+        with self.__lock:
+            pending = self._forget(conn)
+        conn.settimeout(SEND_TIMEOUT)
+        for data in pending or ():
+            conn.sendall(data)
+    
+    def discard(self, conn: ssl.SSLSocket):
+        """Descarta os dados pendentes de uma conexão."""
+        with self.__lock:
+            self._forget(conn)
+    
+    def _forget(self, conn: ssl.SSLSocket):
+        """Remove a fila de uma conexão e a retira do selector."""
+        pending = self.__pending.pop(conn, None)
+        self.__pending_bytes.pop(conn, None)
+        if pending is not None:
+            self.__selector.unregister(conn)
+        return pending
+    
+    @staticmethod
+    def _try_send(conn: ssl.SSLSocket, data) -> int:
+        """Tenta enviar os dados; retorna quantos bytes foram enviados."""
+        try:
+            return conn.send(data)
+        except (ssl.SSLWantWriteError, BlockingIOError):
+            return 0
+    
+    def _run(self):
+        """Drena as filas dos sockets prontos para escrita."""
+        while True:
+            for key, _ in self.__selector.select():
+                conn = key.fileobj
+                if conn is self.__wakeup_r:
+                    try:
+                        self.__wakeup_r.recv(1024)
+                    except BlockingIOError:
+                        pass
+                    continue
+                
+                failed = False
+                with self.__lock:
+                    pending = self.__pending.get(conn)
+                    if pending is None:
+                        continue
+                    try:
+                        # Um envio por mensagem, mantendo-as em registros separados
+                        while pending:
+                            data = pending[0]
+                            sent = self._try_send(conn, data)
+                            self.__pending_bytes[conn] -= sent
+                            if sent < len(data):
+                                pending[0] = data[sent:]
+                                break
+                            pending.popleft()
+                    except OSError:
+                        self._forget(conn)
+                        failed = True
+                    else:
+                        if not pending:
+                            self._forget(conn)
+                
+                if failed:
+                    self.__on_error(conn)
 
 
 class Client:
@@ -39,31 +187,12 @@ class Client:
     
     def __init__(self, username: str):
         self.__connections = Connections()
+        self.__outbox = Outbox(on_error=self._drop_connection)
         self.__concount = 0
         self.username = username
-        self.ssl_context = self._create_ssl_context()
-    
-    def _create_ssl_context(self):
-        """Cria contexto SSL/TLS com mTLS."""
-        context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
-        context.check_hostname = False
-        context.verify_mode = ssl.CERT_REQUIRED
-        
-        # Carrega certificados do usuário
-        cert_path = f"TRACKER/certificates/{self.username}-cert.pem"
-        key_path = f"TRACKER/certificates/{self.username}-key.pem"
-        ca_path = "TRACKER/certificates/ca-cert.pem"
-        
-        try:
-            context.load_cert_chain(certfile=cert_path, keyfile=key_path)
-            context.load_verify_locations(cafile=ca_path)
-            print(f"<SISTEMA>: Certificados carregados para {self.username}")
-        except FileNotFoundError as e:
-            print(f"<SISTEMA>: ERRO - Certificado não encontrado: {e}")
-            print("<SISTEMA>: Execute generate_certificates.py primeiro!")
-            raise
-        
-        return context
+        self.ssl_context = get_client_context(username)
+        # Sessões TLS por peer ("IP:porta"), reutilizadas ao reconectar
+        self.__sessions: dict[str, ssl.SSLSession] = {}
     
     def connect(self, addr: tuple, hostname: str):
         """Estabelece conexão segura com mTLS."""
@@ -73,33 +202,40 @@ class Client:
             
             # Cria socket TCP normal
             sock = socket(AF_INET, SOCK_STREAM)
+            # Evita que um peer que não responde trave o /connect; o Outbox
+            # coloca o socket em modo não-bloqueante depois do handshake
+            sock.settimeout(HANDSHAKE_TIMEOUT)
             
-            # Envolve com SSL/TLS
-            conn = self.ssl_context.wrap_socket(sock, server_hostname=addr[0])
+            # Envolve com SSL/TLS, retomando a sessão anterior com o peer
+            peer_addr = tuple_to_socket(addr)
+            conn = self.ssl_context.wrap_socket(
+                sock,
+                server_hostname=addr[0],
+                session=self.__sessions.get(peer_addr)
+            )
             conn.connect(addr)
             
             # Verifica certificado do peer
-            peer_cert = conn.getpeercert()
-            peer_cn = None
-            for field in peer_cert.get('subject', []):
-                for key, value in field:
-                    if key == 'commonName':
-                        peer_cn = value
-                        break
+            peer_cn = obter_cn(conn.getpeercert())
             
             from utils import clear
             clear()
             print('=' * 70)
             print(f'<SISTEMA>: Conexão SEGURA estabelecida com {tuple_to_socket(addr)}')
             print(f'<SISTEMA>: Certificado do peer verificado: {peer_cn}')
+            if conn.session_reused:
+                print('<SISTEMA>: Sessão TLS retomada (handshake abreviado)')
             print('=' * 70)
             
             # Inicia troca de chaves Diffie-Hellman
-            peer_addr = tuple_to_socket(addr)
             self._exchange_keys(conn, peer_addr)
             
-            self.update_connections(conn)
+            # O ticket de sessão TLS 1.3 chega após o handshake; depois da
+            # resposta do peer ele já está disponível
+            self.__sessions[peer_addr] = conn.session
+            
             self.send_peers(conn, peers_to_str(hostname, peersdb.peers))
+            self.update_connections(conn)
             peersdb.add(peer_addr)
             
             print(f'<SISTEMA>: Chave de sessão estabelecida com {peer_addr}')
@@ -113,8 +249,10 @@ class Client:
             print(f'<SISTEMA>: {e}')
         except Exception as e:
             print(f'<SISTEMA>: Erro ao conectar: {e}')
-            if 'conn' in locals() and conn in self.__connections.connections:
-                self.__connections.remove(conn)
+            if 'conn' in locals():
+                if conn in self.__connections.connections:
+                    self.__connections.remove(conn)
+                conn.close()
     
     def _exchange_keys(self, conn: ssl.SSLSocket, peer_addr: str):
         """Realiza troca de chaves Diffie-Hellman."""
@@ -123,25 +261,15 @@ class Client:
             my_public_key = secure_manager.initiate_key_exchange(peer_addr)
             
             # Envia nossa chave pública
-            key_package = {
-                "type": "DH_KEY_EXCHANGE",
-                "public_key": my_public_key,
-                "username": self.username
-            }
-            conn.sendall(json.dumps(key_package).encode('utf-8'))
+            send_frame(conn, pack_key_exchange(self.username, my_public_key))
             
             # Recebe chave pública do peer
-            data = conn.recv(8192).decode('utf-8')
-            peer_package = json.loads(data)
+            peer_username, peer_public_key = recv_key_exchange(conn)
             
-            if peer_package["type"] == "DH_KEY_EXCHANGE":
-                peer_public_key = peer_package["public_key"]
-                peer_username = peer_package.get("username", "unknown")
-                
-                # Calcula chave compartilhada
-                secure_manager.complete_key_exchange(peer_addr, peer_public_key)
-                
-                print(f'<SISTEMA>: Troca de chaves DH concluída com {peer_username}')
+            # Calcula chave compartilhada
+            secure_manager.complete_key_exchange(peer_addr, peer_public_key)
+            
+            print(f'<SISTEMA>: Troca de chaves DH concluída com {peer_username}')
             
         except Exception as e:
             print(f'<SISTEMA>: Erro na troca de chaves: {e}')
@@ -149,7 +277,10 @@ class Client:
     
     def send_msg(self, msg: str):
         """Envia mensagem com HMAC para todos os peers conectados."""
-        for c in list(self.__connections.connections):
+        # Codifica uma única vez; apenas o HMAC depende do peer
+        msg_bytes = msg.encode('utf-8')
+        
+        for c in self.__connections.connections:
             try:
                 # Obtém endereço do peer
                 peer_addr = tuple_to_socket(c.getpeername())
@@ -158,23 +289,28 @@ class Client:
                 security = secure_manager.get_security(peer_addr)
                 
                 if security:
-                    # Empacota mensagem com HMAC
-                    package = security.package_message(msg)
-                    c.sendall(package.encode('utf-8'))
+                    # Empacota mensagem com HMAC, em um quadro
+                    self.__outbox.send(c, pack_frame(security.package_bytes(msg_bytes)))
                 else:
                     print(f'<SISTEMA>: AVISO - Sem chave segura para {peer_addr}')
                     
             except Exception as e:
                 print(f'<SISTEMA>: Erro ao enviar mensagem: {e}')
-                self.__connections.remove(c)
-                c.close()
+                self._drop_connection(c)
+    
+    def _drop_connection(self, conn: ssl.SSLSocket):
+        """Remove e fecha uma conexão que falhou."""
+        self.__outbox.discard(conn)
+        self.__connections.remove(conn)
+        conn.close()
     
     def send_peers(self, conn: ssl.SSLSocket, peers: str):
         """Envia lista de peers."""
-        conn.sendall(peers.encode('utf-8'))
+        send_frame(conn, peers.encode('utf-8'))
     
     def update_connections(self, conn: ssl.SSLSocket):
         """Atualiza lista de conexões."""
+        self.__outbox.register(conn)
         self.__connections.add(conn)
         self.__concount += 1
     
@@ -186,18 +322,27 @@ class Client:
     def disconnect(self, addr_str: str):
         """Encerra conexão com um peer."""
         addr = socket_to_tuple(addr_str)
-        for conn in list(self.__connections.connections):
+        for conn in self.__connections.connections:
             try:
-                if conn.getpeername() == addr:
-                    conn.sendall("__DISCONNECT__".encode('utf-8'))
-                    conn.close()
-                    self.__connections.remove(conn)
-                    peersdb.remove(addr_str)
-                    secure_manager.remove_peer(addr_str)
-                    print(f"<SISTEMA>: Conexão encerrada com {addr_str}")
-                    return
+                if conn.getpeername() != addr:
+                    continue
+            except OSError:
+                continue
+            
+            try:
+                # Envia o que estiver pendente antes de avisar o peer; um
+                # peer que parou de ler estoura o SEND_TIMEOUT
+                self.__outbox.flush(conn)
+                send_frame(conn, b"__DISCONNECT__")
             except Exception as e:
                 print(f"<SISTEMA>: Erro ao desconectar: {e}")
+            
+            # Encerra a conexão mesmo que o aviso não tenha sido entregue
+            self._drop_connection(conn)
+            peersdb.remove(addr_str)
+            secure_manager.remove_peer(addr_str)
+            print(f"<SISTEMA>: Conexão encerrada com {addr_str}")
+            return
         print(f"<SISTEMA>: Conexão com {addr_str} não encontrada.")
 
 # Instância global do cliente (será criada no main.py)
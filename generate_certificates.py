@@ -4,30 +4,95 @@ Script para gerar certificados SSL/TLS para o chat seguro.
 Gera uma CA (Certificate Authority) e certificados para cada usuário.
 """
 
+import datetime
 import os
 import subprocess
 from pathlib import Path
 
+try:
+    # Geração em processo (sem chamar o executável openssl), se disponível
+    from cryptography import x509
+    from cryptography.x509.oid import NameOID
+    from cryptography.hazmat.primitives import hashes, serialization
+    from cryptography.hazmat.primitives.asymmetric import ed25519
+except ImportError:
+    x509 = None
+
+# Validade dos certificados em dias
+VALIDADE_DIAS = 365
+
 def criar_diretorio_certificados():
     """Cria a estrutura de diretórios para os certificados."""
     Path("TRACKER/certificates").mkdir(parents=True, exist_ok=True)
     os.chdir("TRACKER/certificates")
 
+def _nome(cn: str):
+    """Monta o nome distinto (subject/issuer) usado nos certificados."""
+    return x509.Name([
+        x509.NameAttribute(NameOID.COUNTRY_NAME, "BR"),
+        x509.NameAttribute(NameOID.STATE_OR_PROVINCE_NAME, "DF"),
+        x509.NameAttribute(NameOID.LOCALITY_NAME, "Brasilia"),
+        x509.NameAttribute(NameOID.ORGANIZATION_NAME, "ChatP2P"),
+        x509.NameAttribute(NameOID.COMMON_NAME, cn),
+    ])
+
+def _gerar_chave(caminho: str):
+    """Gera uma chave Ed25519 e a salva em PEM (PKCS#8, sem senha)."""
+    chave = ed25519.Ed25519PrivateKey.generate()
+    with open(caminho, "wb") as f:
+        f.write(chave.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption()
+        ))
+    return chave
+
+def _emitir_certificado(caminho: str, subject, issuer, chave_publica,
+                        chave_assinatura, ca: bool):
+    """Emite um certificado X.509 assinado e o salva em PEM."""
+    agora = datetime.datetime.now(datetime.timezone.utc)
+    # Ed25519 não usa hash externo; uma CA RSA antiga continua com SHA-256
+    if isinstance(chave_assinatura, ed25519.Ed25519PrivateKey):
+        algoritmo = None
+    else:
+        algoritmo = hashes.SHA256()
+    
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(subject)
+        .issuer_name(issuer)
+        .public_key(chave_publica)
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(agora)
+        .not_valid_after(agora + datetime.timedelta(days=VALIDADE_DIAS))
+        .add_extension(x509.BasicConstraints(ca=ca, path_length=None), critical=True)
+        .sign(chave_assinatura, algoritmo)
+    )
+    with open(caminho, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+
 def gerar_ca():
     """Gera a Certificate Authority (CA)."""
     print("\n<SISTEMA>: Gerando Certificate Authority (CA)...")
     
+    if x509 is not None:
+        chave = _gerar_chave("ca-key.pem")
+        nome = _nome("ChatP2P-CA")
+        _emitir_certificado("ca-cert.pem", nome, nome, chave.public_key(), chave, ca=True)
+        print("<SISTEMA>: CA gerada com sucesso!")
+        return
+    
     # Gera chave privada da CA
     subprocess.run([
-        "openssl", "genrsa",
-        "-out", "ca-key.pem",
-        "4096"
+        "openssl", "genpkey",
+        "-algorithm", "ED25519",
+        "-out", "ca-key.pem"
     ], check=True)
     
     # Gera certificado da CA
     subprocess.run([
         "openssl", "req", "-new", "-x509",
-        "-days", "365",
+        "-days", str(VALIDADE_DIAS),
         "-key", "ca-key.pem",
         "-out", "ca-cert.pem",
         "-subj", "/C=BR/ST=DF/L=Brasilia/O=ChatP2P/CN=ChatP2P-CA"
@@ -39,11 +104,25 @@ def gerar_certificado_usuario(username):
     """Gera certificado para um usuário específico."""
     print(f"\n<SISTEMA>: Gerando certificado para {username}...")
     
+    if x509 is not None:
+        with open("ca-key.pem", "rb") as f:
+            chave_ca = serialization.load_pem_private_key(f.read(), password=None)
+        with open("ca-cert.pem", "rb") as f:
+            cert_ca = x509.load_pem_x509_certificate(f.read())
+        
+        chave = _gerar_chave(f"{username}-key.pem")
+        _emitir_certificado(
+            f"{username}-cert.pem", _nome(username), cert_ca.subject,
+            chave.public_key(), chave_ca, ca=False
+        )
+        print(f"<SISTEMA>: Certificado para {username} gerado com sucesso!")
+        return
+    
     # Gera chave privada do usuário
     subprocess.run([
-        "openssl", "genrsa",
-        "-out", f"{username}-key.pem",
-        "4096"
+        "openssl", "genpkey",
+        "-algorithm", "ED25519",
+        "-out", f"{username}-key.pem"
     ], check=True)
     
     # Gera Certificate Signing Request (CSR)
@@ -62,7 +141,7 @@ def gerar_certificado_usuario(username):
         "-CAkey", "ca-key.pem",
         "-CAcreateserial",
         "-out", f"{username}-cert.pem",
-        "-days", "365"
+        "-days", str(VALIDADE_DIAS)
     ], check=True)
     
     # Remove o CSR (não é mais necessário)
@@ -76,14 +155,15 @@ def main():
     print("GERADOR DE CERTIFICADOS - CHAT P2P SEGURO")
     print("=" * 70)
     
-    # Verifica se OpenSSL está instalado
-    try:
-        subprocess.run(["openssl", "version"], 
-                      capture_output=True, check=True)
-    except (subprocess.CalledProcessError, FileNotFoundError):
-        print("<SISTEMA>: ERRO - OpenSSL não encontrado!")
-        print("<SISTEMA>: Instale o OpenSSL antes de continuar.")
-        return
+    # Sem a biblioteca cryptography, é preciso o executável do OpenSSL
+    if x509 is None:
+        try:
+            subprocess.run(["openssl", "version"], 
+                          capture_output=True, check=True)
+        except (subprocess.CalledProcessError, FileNotFoundError):
+            print("<SISTEMA>: ERRO - OpenSSL não encontrado!")
+            print("<SISTEMA>: Instale o OpenSSL ou a biblioteca cryptography.")
+            return
     
     criar_diretorio_certificados()
     
@@ -14,6 +14,7 @@ from TRACKER.userinfo.userinfo import User
 from TRACKER.logs.logger import logger
 from security import secure_manager
 import os
+import sys
 
 def verificar_certificados(username: str) -> bool:
     """Verifica se os certificados do usuário existem."""
@@ -63,6 +64,31 @@ def mostrar_info_seguranca():
     print("  • INTEGRIDADE: HMAC detecta adulterações")
     print("=" * 70 + "\n")
 
+def mostrar_status_seguro(e: str):
+    """Exibe os peers com chave de sessão estabelecida."""
+    peers = list(secure_manager.peer_keys)
+    if peers:
+        print(
+            "\n<SISTEMA>: Conexões seguras estabelecidas:\n"
+            + "\n".join(f"  • {peer}" for peer in peers) + "\n"
+        )
+    else:
+        print("\n<SISTEMA>: Nenhuma conexão segura estabelecida ainda.\n\n")
+
+def criar_sala(e: str):
+    """Cria uma sala privada: /create_room <nome> <porta> <senha>."""
+    partes = e.split()
+    if len(partes) < 4:
+        print("<SISTEMA>: Uso: /create_room <nome> <porta> <senha>")
+        return
+    
+    print(salasdb.criar_sala_com_servidor(
+        nome=partes[1],
+        porta=int(partes[2]),
+        senha=partes[3],
+        criador=str(usuario)
+    ))
+
 # Inicialização
 clear()
 print("=" * 70)
@@ -99,34 +125,23 @@ comandos = {
         socket_to_tuple(e.split()[1]), 
         obter_hostname(PORTA)
     ),
-    '/peers': lambda e: print(f"\n<SISTEMA>: Peers conhecidos:\n{peersdb.peers}\n"),
+    '/peers': lambda e: print(
+        "\n<SISTEMA>: Peers conhecidos:\n" + "\n".join(sorted(peersdb.get_all())) + "\n"
+    ),
     '/connections': lambda e: print(
         f"\n<SISTEMA>: Conexões ativas: {cliente.connections[1]}\n"
     ),
-    '/secure_status': lambda e: (
-        print("\n<SISTEMA>: Conexões seguras estabelecidas:")
-        if secure_manager.peer_keys
-        else print("\n<SISTEMA>: Nenhuma conexão segura estabelecida ainda.\n"),
-        [print(f"  • {peer}") for peer in secure_manager.peer_keys.keys()] if secure_manager.peer_keys else None,
-        print()
-    ),
+    '/secure_status': mostrar_status_seguro,
     '/resignin': lambda e: usuario.signin(),
-    '/create_room': lambda e: print(
-        "<SISTEMA>: Uso: /create_room <nome> <porta> <senha>"
-        if len(e.split()) < 4
-        else salasdb.criar_sala_com_servidor(
-            nome=e.split()[1],
-            porta=int(e.split()[2]),
-            senha=e.split()[3],
-            criador=str(usuario)
-        )
-    ),
+    '/create_room': criar_sala,
     '/disconnect': lambda e: cliente.disconnect(e.split()[1]),
     '/enter_room': lambda e: entrar_na_sala(e),
     '/clear': lambda e: (clear(), mostrar_info_seguranca()),
     '/menu': lambda e: mostrar_comandos(),
     '/security_info': lambda e: mostrar_info_seguranca()
 }
+# Chaves internadas: a busca do comando digitado compara ponteiros
+comandos = {sys.intern(k): v for k, v in comandos.items()}
 
 mostrar_comandos()
 print("\n<SISTEMA>: Sistema pronto! Digite /security_info para ver detalhes de segurança.\n")
@@ -142,7 +157,8 @@ if __name__ == '__main__':
             
             if e[0] == '/':
                 try:
-                    comando = e.split()[0]
+                    sp = e.find(' ')
+                    comando = sys.intern(e[:sp] if sp > 0 else e)
                     if comando in comandos:
                         comandos[comando](e)
                     else:
@@ -154,9 +170,9 @@ if __name__ == '__main__':
                     print(f'<SISTEMA>: Erro ao executar comando: {err}')
             else:
                 # Envia mensagem
-                nome_sala = salasdb.usuarios_sala.get(str(usuario), None)
-                if nome_sala:
-                    msg = f'[{nome_sala}] <{usuario}>: {e}'
+                sala = salasdb.sala_de(str(usuario))
+                if sala:
+                    msg = f'[{sala.nome}] <{usuario}>: {e}'
                 else:
                     msg = f'<{usuario}>: {e}'
                 
@@ -44,13 +44,14 @@ class PeersDatabase:
     
     def multi_add(self, peers: list):
         """
-        Adiciona múltiplos peers ao banco de dados.
+        Adiciona múltiplos peers ao banco de dados com uma única
+        aquisição do Lock.
         
         Args:
-            peers: Lista de endereços de peers
+            peers: Coleção de endereços de peers
         """
-        for peer in peers:
-            self.add(peer)
+        with self.__lock:
+            self.peers.update(peers)
     
     def remove(self, peer):
         """
@@ -68,15 +69,17 @@ class PeersDatabase:
         with self.__lock:
             self.peers.clear()
     
-    def get_all(self) -> set:
+    def get_all(self) -> frozenset:
         """
-        Retorna uma cópia do conjunto de peers.
+        Retorna um retrato imutável do conjunto de peers.
+        
+        As leituras não usam o Lock: copiar, medir ou consultar um set são
+        operações atômicas sob o GIL. Apenas as escritas são sincronizadas.
         
         Returns:
-            set: Conjunto com todos os peers conhecidos
+            frozenset: Conjunto com todos os peers conhecidos
         """
-        with self.__lock:
-            return self.peers.copy()
+        return frozenset(self.peers)
     
     def count(self) -> int:
         """
@@ -85,8 +88,7 @@ class PeersDatabase:
         Returns:
             int: Quantidade de peers
         """
-        with self.__lock:
-            return len(self.peers)
+        return len(self.peers)
     
     def exists(self, peer) -> bool:
         """
@@ -98,8 +100,7 @@ class PeersDatabase:
         Returns:
             bool: True se o peer existe, False caso contrário
         """
-        with self.__lock:
-            return peer in self.peers
+        return peer in self.peers
 
 # Instância global do banco de dados de peers
 peersdb = PeersDatabase()
\ No newline at end of file
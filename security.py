@@ -6,8 +6,37 @@ Implementa: Diffie-Hellman, HMAC, e gerenciamento de chaves.
 import hmac
 import hashlib
 import secrets
-import json
+import ssl
+import struct
+import warnings
+from functools import lru_cache
 from pathlib import Path
+from utils import recv_frame
+
+try:
+    # Backend em C (OpenSSL) para o Diffie-Hellman, se disponível
+    from cryptography.hazmat.primitives.asymmetric import dh
+    from cryptography.exceptions import UnsupportedAlgorithm
+    from cryptography.utils import CryptographyDeprecationWarning
+    # O grupo MODP (RFC 3526) faz parte do protocolo do chat; evita que o
+    # aviso de depreciação do FFDH apareça no meio da conversa
+    warnings.filterwarnings(
+        "ignore",
+        message=r"Diffie-Hellman over finite fields",
+        category=CryptographyDeprecationWarning,
+    )
+except ImportError:
+    dh = None
+
+try:
+    # Exponenciação modular da GMP, usada quando o cryptography não está
+    # disponível
+    import gmpy2
+except ImportError:
+    gmpy2 = None
+
+# Tamanho do HMAC-SHA256 em bytes
+HMAC_SIZE = 32
 
 class DiffieHellman:
     """
@@ -32,11 +61,26 @@ class DiffieHellman:
     )
     G = 2
     
+    # Tamanho de P em bytes (2048 bits)
+    KEY_SIZE = 256
+    
+    # Tamanho do expoente privado: 256 bits bastam para o nível de segurança
+    # do grupo de 2048 bits (NIST SP 800-56A / RFC 7919)
+    PRIVATE_KEY_BITS = 256
+    
     def __init__(self):
-        """Inicializa o Diffie-Hellman gerando a chave privada."""
-        self.private_key = secrets.randbelow(self.P - 2) + 1
-        self.public_key = pow(self.G, self.private_key, self.P)
+        """
+        Inicializa o Diffie-Hellman gerando a chave privada.
+        Usa o OpenSSL (via cryptography) quando disponível.
+        """
+        if _DH_PARAMETERS is not None:
+            self.private_key = _DH_PARAMETERS.generate_private_key()
+            self.public_key = self.private_key.public_key().public_numbers().y
+        else:
+            self.private_key = secrets.randbits(self.PRIVATE_KEY_BITS) | 1
+            self.public_key = _powmod(self.G, self.private_key)
         self.shared_secret = None
+        self._derived_key = None
     
     def get_public_key(self) -> int:
         """Retorna a chave pública para enviar ao peer."""
@@ -45,16 +89,93 @@ class DiffieHellman:
     def compute_shared_secret(self, peer_public_key: int):
         """
         Calcula a chave compartilhada usando a chave pública do peer.
+        Rejeita chaves triviais (0, 1, P-1), que gerariam um segredo previsível.
         """
-        self.shared_secret = pow(peer_public_key, self.private_key, self.P)
-        # Deriva uma chave de 32 bytes a partir do segredo compartilhado
-        return hashlib.sha256(str(self.shared_secret).encode()).digest()
+        if not 1 < peer_public_key < self.P - 1:
+            raise ValueError("Chave pública DH do peer fora do intervalo válido")
+        if _DH_PARAMETERS is not None:
+            peer_key = dh.DHPublicNumbers(
+                peer_public_key,
+                _DH_PARAMETERS.parameter_numbers()
+            ).public_key()
+            self.shared_secret = int.from_bytes(self.private_key.exchange(peer_key), 'big')
+        else:
+            self.shared_secret = _powmod(peer_public_key, self.private_key)
+        # Deriva (uma única vez) uma chave de 32 bytes a partir do segredo
+        self._derived_key = hashlib.sha256(
+            self.shared_secret.to_bytes(self.KEY_SIZE, 'big')
+        ).digest()
+        return self._derived_key
     
     def get_shared_secret(self) -> bytes:
         """Retorna a chave compartilhada derivada."""
-        if self.shared_secret is None:
+        if self._derived_key is None:
             raise Exception("Segredo compartilhado ainda não calculado!")
-        return hashlib.sha256(str(self.shared_secret).encode()).digest()
+        return self._derived_key
+
+
+# Parâmetros do grupo no formato do OpenSSL (calculados uma única vez).
+# Se a versão do cryptography não suportar mais FFDH, usa o caminho em Python.
+_DH_PARAMETERS = None
+if dh is not None:
+    try:
+        _DH_PARAMETERS = dh.DHParameterNumbers(
+            DiffieHellman.P, DiffieHellman.G
+        ).parameters()
+    except (AttributeError, ValueError, UnsupportedAlgorithm):
+        _DH_PARAMETERS = None
+
+# Módulo P já convertido para o formato da GMP
+_P_MPZ = gmpy2.mpz(DiffieHellman.P) if gmpy2 is not None else None
+
+
+def _powmod(base: int, exponent: int) -> int:
+    """Calcula base^exponent mod P, usando a GMP quando disponível."""
+    if _P_MPZ is not None:
+        return int(gmpy2.powmod(base, exponent, _P_MPZ))
+    return pow(base, exponent, DiffieHellman.P)
+
+
+def pack_key_exchange(username: str, public_key: int) -> bytes:
+    """
+    Empacota a chave pública DH para envio ao peer.
+    Formato: tam. nome (uint16) | nome UTF-8 | tam. chave (uint16) | chave big-endian
+    """
+    name = username.encode('utf-8')
+    key = public_key.to_bytes(DiffieHellman.KEY_SIZE, 'big')
+    return (
+        struct.pack("!H", len(name)) + name +
+        struct.pack("!H", len(key)) + key
+    )
+
+
+def unpack_key_exchange(data: bytes) -> tuple:
+    """
+    Desempacota a chave pública DH recebida do peer.
+    Retorna: (nome do usuário, chave pública)
+    Levanta ValueError se o pacote estiver malformado.
+    """
+    try:
+        (name_len,) = struct.unpack_from("!H", data, 0)
+        name = data[2:2 + name_len].decode('utf-8')
+        offset = 2 + name_len
+        (key_len,) = struct.unpack_from("!H", data, offset)
+        key = data[offset + 2:offset + 2 + key_len]
+    except (struct.error, UnicodeDecodeError) as e:
+        raise ValueError(f"Pacote de troca de chaves inválido: {e}") from e
+    
+    if len(key) != key_len:
+        raise ValueError("Pacote de troca de chaves incompleto")
+    
+    return name, int.from_bytes(key, 'big')
+
+
+def recv_key_exchange(conn) -> tuple:
+    """
+    Lê do socket o quadro com o pacote de troca de chaves.
+    Retorna: (nome do usuário, chave pública)
+    """
+    return unpack_key_exchange(recv_frame(conn))
 
 
 class MessageSecurity:
@@ -68,25 +189,32 @@ class MessageSecurity:
         Inicializa com uma chave compartilhada.
         Se não fornecida, gera uma chave aleatória.
         """
-        self.shared_key = shared_key or secrets.token_bytes(32)
+        self.set_shared_key(shared_key or secrets.token_bytes(32))
     
     def set_shared_key(self, key: bytes):
-        """Define a chave compartilhada."""
+        """
+        Define a chave compartilhada.
+        Pré-calcula o estado do HMAC com a chave (ipad/opad), que é
+        copiado a cada mensagem em vez de ser refeito. O digest é
+        indicado pelo nome para usar diretamente o HMAC do OpenSSL.
+        """
         self.shared_key = key
+        self._template = hmac.new(key, b"", digestmod='sha256')
     
-    def create_hmac(self, message: str) -> str:
+    def _digest(self, data: bytes) -> bytes:
+        """Calcula o HMAC-SHA256 de dados já codificados."""
+        h = self._template.copy()
+        h.update(data)
+        return h.digest()
+    
+    def create_hmac(self, message: str) -> bytes:
         """
         Cria um HMAC para a mensagem usando SHA-256.
-        Retorna o HMAC em formato hexadecimal.
+        Retorna o HMAC em bytes (32 bytes).
         """
-        h = hmac.new(
-            self.shared_key,
-            message.encode('utf-8'),
-            hashlib.sha256
-        )
-        return h.hexdigest()
+        return self._digest(message.encode('utf-8'))
     
-    def verify_hmac(self, message: str, received_hmac: str) -> bool:
+    def verify_hmac(self, message: str, received_hmac: bytes) -> bool:
         """
         Verifica se o HMAC recebido corresponde à mensagem.
         Retorna True se válido, False caso contrário.
@@ -94,34 +222,118 @@ class MessageSecurity:
         expected_hmac = self.create_hmac(message)
         return hmac.compare_digest(expected_hmac, received_hmac)
     
-    def package_message(self, message: str) -> str:
+    def verify_many(self, messages: list, tags: list) -> list:
+        """
+        Verifica em lote os HMACs de várias mensagens já codificadas.
+        Retorna uma lista de bool na mesma ordem das mensagens.
+        """
+        new = self._template.copy
+        compare = hmac.compare_digest
+        results = []
+        for data, tag in zip(messages, tags, strict=True):
+            h = new()
+            h.update(data)
+            results.append(compare(h.digest(), tag))
+        return results
+    
+    def package_message(self, message: str) -> bytes:
         """
         Empacota uma mensagem com seu HMAC.
-        Formato: {"msg": "mensagem", "hmac": "hmac_value"}
+        Formato: HMAC (32 bytes) seguido da mensagem em UTF-8.
         """
-        mac = self.create_hmac(message)
-        package = {
-            "msg": message,
-            "hmac": mac
-        }
-        return json.dumps(package)
+        return self.package_bytes(message.encode('utf-8'))
     
-    def unpackage_message(self, package: str) -> tuple:
+    def package_bytes(self, data: bytes) -> bytes:
+        """
+        Empacota uma mensagem já codificada em UTF-8 com seu HMAC.
+        Permite codificar a mensagem uma única vez ao enviá-la a vários peers.
+        """
+        return self._digest(data) + data
+    
+    def unpackage_message(self, package: bytes) -> tuple:
         """
         Desempacota uma mensagem e verifica sua integridade.
         Retorna: (mensagem, válido)
         """
+        if len(package) < HMAC_SIZE:
+            return None, False
+        
+        # Fatias de memoryview evitam copiar o corpo da mensagem
+        view = memoryview(package)
+        body = view[HMAC_SIZE:]
+        expected_hmac = self._digest(body)
+        
+        if not hmac.compare_digest(expected_hmac, view[:HMAC_SIZE]):
+            return None, False
+        
         try:
-            data = json.loads(package)
-            message = data["msg"]
-            received_hmac = data["hmac"]
-            
-            is_valid = self.verify_hmac(message, received_hmac)
-            return message, is_valid
-        except (json.JSONDecodeError, KeyError):
+            return str(body, 'utf-8'), True
+        except UnicodeDecodeError:
             return None, False
 
 
+def _load_certificates(context: ssl.SSLContext, username: str):
+    """
+    Carrega o certificado do usuário e a CA no contexto TLS e aplica as
+    opções comuns a cliente e servidor.
+    """
+    cert_path = f"TRACKER/certificates/{username}-cert.pem"
+    key_path = f"TRACKER/certificates/{username}-key.pem"
+    ca_path = "TRACKER/certificates/ca-cert.pem"
+    
+    context.verify_mode = ssl.CERT_REQUIRED  # mTLS: exige certificado do peer
+    context.options |= ssl.OP_NO_COMPRESSION | ssl.OP_NO_RENEGOTIATION
+    # Apenas TLS 1.3: todas as suítes são AEAD e o OpenSSL prefere
+    # TLS_AES_256_GCM_SHA384 (acelerada por AES-NI/CLMUL)
+    context.minimum_version = ssl.TLSVersion.TLSv1_3
+    
+    context.load_cert_chain(certfile=cert_path, keyfile=key_path)
+    context.load_verify_locations(cafile=ca_path)
+
+
+@lru_cache(maxsize=1)
+def get_client_context(username: str) -> ssl.SSLContext:
+    """
+    Retorna o contexto TLS de cliente (mTLS) do usuário.
+    O contexto é criado uma única vez e compartilhado por todas as conexões.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_CLIENT)
+    context.check_hostname = False
+    
+    try:
+        _load_certificates(context, username)
+        print(f"<SISTEMA>: Certificados carregados para {username}")
+    except FileNotFoundError as e:
+        print(f"<SISTEMA>: ERRO - Certificado não encontrado: {e}")
+        print("<SISTEMA>: Execute generate_certificates.py primeiro!")
+        raise
+    
+    return context
+
+
+@lru_cache(maxsize=1)
+def get_server_context(username: str) -> ssl.SSLContext:
+    """
+    Retorna o contexto TLS de servidor (mTLS) do usuário.
+    O contexto é criado uma única vez e compartilhado pelo servidor
+    principal e pelos servidores das salas.
+    """
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    # Emite tickets de sessão TLS 1.3 para que peers que se reconectam
+    # retomem a sessão sem repetir a validação dos certificados
+    context.options &= ~ssl.OP_NO_TICKET
+    context.num_tickets = 2
+    
+    try:
+        _load_certificates(context, username)
+        print(f"<SISTEMA>: Servidor SSL configurado para {username}")
+    except FileNotFoundError as e:
+        print(f"<SISTEMA>: ERRO - Certificado não encontrado: {e}")
+        raise
+    
+    return context
+
+
 class SecureConnectionManager:
     """
     Gerencia conexões seguras e suas chaves compartilhadas.
@@ -4,10 +4,28 @@ Script de teste para validar as funcionalidades de segurança.
 Testa: HMAC, Diffie-Hellman, e integração básica.
 """
 
+import os
 import sys
+import socket
+import tempfile
+import threading
 import hashlib
 import hmac as hmac_lib
-from security import DiffieHellman, MessageSecurity, SecureConnectionManager
+from security import (
+    DiffieHellman, MessageSecurity, SecureConnectionManager,
+    pack_key_exchange, unpack_key_exchange, recv_key_exchange
+)
+from utils import pack_frame, recv_frame
+
+# Quantidade de mensagens no modo estresse do teste de resistência
+N_ESTRESSE = 5000
+
+# Escritores simultâneos e registros por escritor no teste do logger
+N_ESCRITORES = 4
+N_REGISTROS = 500
+
+# Quadros (de ~20 KB) enviados a um peer que não está lendo no teste do Outbox
+N_QUADROS = 200
 
 def print_header(title):
     """Imprime cabeçalho formatado."""
@@ -40,14 +58,24 @@ def test_diffie_hellman():
     print(f"Bob calculou:   {bob_shared.hex()[:32]}...")
     
     print("\n4. Verificando se os segredos são iguais...")
-    if alice_shared == bob_shared:
+    if alice_shared == bob_shared and alice_dh.get_shared_secret() == alice_shared:
         print("SUCESSO: Segredos compartilhados são IGUAIS!")
         print(f"Tamanho da chave: {len(alice_shared) * 8} bits")
-        return True
     else:
         print("FALHA: Segredos diferentes!")
         return False
 
+    print("\n5. Testando chaves públicas triviais (0, 1, P-1)...")
+    for chave in (0, 1, DiffieHellman.P - 1):
+        try:
+            DiffieHellman().compute_shared_secret(chave)
+            print("FALHA: Chave pública trivial aceita!")
+            return False
+        except ValueError:
+            pass
+    print("SUCESSO: Chaves públicas triviais rejeitadas")
+    return True
+
 def test_hmac_integrity():
     """Testa a verificação de integridade com HMAC."""
     print_header("TESTE 2: HMAC - INTEGRIDADE DE MENSAGENS")
@@ -63,7 +91,7 @@ def test_hmac_integrity():
     msg1 = "Olá Bob! Esta mensagem tem integridade."
     hmac1 = security.create_hmac(msg1)
     print(f"Mensagem: '{msg1}'")
-    print(f"HMAC: {hmac1[:32]}...")
+    print(f"HMAC: {hmac1.hex()[:32]}...")
     
     is_valid = security.verify_hmac(msg1, hmac1)
     if is_valid:
@@ -78,7 +106,7 @@ def test_hmac_integrity():
     
     if not is_valid_adulterada:
         print(f"Mensagem adulterada: '{msg2_adulterada}'")
-        print(f"HMAC original usado: {hmac1[:32]}...")
+        print(f"HMAC original usado: {hmac1.hex()[:32]}...")
         print("SUCESSO: Adulteração DETECTADA!")
     else:
         print("FALHA: Adulteração NÃO detectada!")
@@ -86,15 +114,24 @@ def test_hmac_integrity():
     
     print("\n4. Testando empacotamento de mensagem...")
     package = security.package_message(msg1)
-    print(f"Pacote JSON: {package[:80]}...")
+    print(f"Pacote binário: {package.hex()[:80]}...")
     
     unpacked_msg, is_valid_unpacked = security.unpackage_message(package)
     if is_valid_unpacked and unpacked_msg == msg1:
         print("Mensagem desempacotada e verificada com sucesso!")
-        return True
     else:
         print("Falha ao desempacotar/verificar!")
         return False
+    
+    print("\n5. Testando pacote adulterado...")
+    pacote_adulterado = package[:-1] + b"?"
+    _, is_valid_adulterado = security.unpackage_message(pacote_adulterado)
+    if not is_valid_adulterado:
+        print("SUCESSO: Pacote adulterado REJEITADO!")
+        return True
+    else:
+        print("FALHA: Pacote adulterado aceito!")
+        return False
 
 def test_secure_connection_manager():
     """Testa o gerenciador de conexões seguras."""
@@ -165,7 +202,7 @@ def test_hmac_resistance():
     
     print("\n1. Mensagem original:")
     print(f"Texto: '{msg}'")
-    print(f"HMAC: {hmac_original}")
+    print(f"HMAC: {hmac_original.hex()}")
     
     print("\n2. Testando modificações mínimas...")
     
@@ -173,7 +210,7 @@ def test_hmac_resistance():
     msg_mod1 = msg + " "
     hmac_mod1 = security.create_hmac(msg_mod1)
     print(f"\na) Mensagem: '{msg_mod1}'")
-    print(f"HMAC: {hmac_mod1}")
+    print(f"HMAC: {hmac_mod1.hex()}")
     if hmac_mod1 != hmac_original:
         print(f"Espaço detectado (HMACs diferentes)")
     else:
@@ -184,7 +221,7 @@ def test_hmac_resistance():
     msg_mod2 = msg.replace('i', 'I')
     hmac_mod2 = security.create_hmac(msg_mod2)
     print(f"\nb) Mensagem: '{msg_mod2}'")
-    print(f"HMAC: {hmac_mod2}")
+    print(f"HMAC: {hmac_mod2.hex()}")
     if hmac_mod2 != hmac_original:
         print(f"Letra maiúscula detectada (HMACs diferentes)")
     else:
@@ -195,13 +232,203 @@ def test_hmac_resistance():
     msg_mod3 = msg + "!"
     hmac_mod3 = security.create_hmac(msg_mod3)
     print(f"\nc) Mensagem: '{msg_mod3}'")
-    print(f"HMAC: {hmac_mod3}")
+    print(f"HMAC: {hmac_mod3.hex()}")
     if hmac_mod3 != hmac_original:
         print(f"Exclamação detectada (HMACs diferentes)")
-        return True
     else:
         print(f"Falha: HMACs iguais!")
         return False
+    
+    # Teste 4: Modo estresse, um bit alterado em cada mensagem
+    print(f"\n3. Modo estresse: {N_ESTRESSE} mensagens com um bit alterado...")
+    originais = [f"{msg} #{i}".encode('utf-8') for i in range(N_ESTRESSE)]
+    tags = [security.create_hmac(m.decode('utf-8')) for m in originais]
+    alteradas = [bytes([m[0] ^ (1 << (i % 8))]) + m[1:] for i, m in enumerate(originais)]
+    
+    aceitas = security.verify_many(originais, tags)
+    rejeitadas = security.verify_many(alteradas, tags)
+    if all(aceitas) and not any(rejeitadas):
+        print(f"Todas as {N_ESTRESSE} alterações detectadas")
+        return True
+    print(f"Falha: {rejeitadas.count(True)} alterações não detectadas!")
+    return False
+
+def test_key_exchange_packing():
+    """Testa o empacotamento binário da troca de chaves."""
+    print_header("TESTE 5: EMPACOTAMENTO DA TROCA DE CHAVES")
+    
+    print("\n1. Empacotando chave pública de Alice...")
+    dh = DiffieHellman()
+    package = pack_key_exchange("alice", dh.get_public_key())
+    print(f"Tamanho do pacote: {len(package)} bytes")
+    
+    print("\n2. Desempacotando...")
+    username, public_key = unpack_key_exchange(package)
+    if username == "alice" and public_key == dh.get_public_key():
+        print("Usuário e chave pública recuperados corretamente")
+    else:
+        print("Falha ao desempacotar a troca de chaves!")
+        return False
+    
+    print("\n3. Testando pacote truncado...")
+    try:
+        unpack_key_exchange(package[:-10])
+        print("FALHA: Pacote truncado aceito!")
+        return False
+    except ValueError as e:
+        print(f"SUCESSO: Pacote truncado rejeitado ({e})")
+    
+    print("\n4. Lendo pacote fragmentado de um socket...")
+    frame = pack_frame(package)
+    sender, receiver = socket.socketpair()
+    try:
+        sender.sendall(frame[:3])
+        sender.sendall(frame[3:] + pack_frame(b"dados seguintes"))
+        username, public_key = recv_key_exchange(receiver)
+        resto = recv_frame(receiver)
+    finally:
+        sender.close()
+        receiver.close()
+    
+    if public_key == dh.get_public_key() and resto == b"dados seguintes":
+        print("SUCESSO: Pacote lido por inteiro, sem consumir o quadro seguinte")
+        return True
+    print("FALHA: Leitura do pacote incorreta!")
+    return False
+
+def test_logger():
+    """Testa o logger com escritores simultâneos, limpeza e leitura."""
+    print_header("TESTE 6: LOGGER COM ESCRITORES CONCORRENTES")
+    
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as tmp:
+        # A instância global do módulo usa um caminho relativo; importa a
+        # partir do diretório temporário para não criar logs no repositório
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            from TRACKER.logs.logger import Logger
+        finally:
+            os.chdir(cwd)
+        
+        log = Logger(os.path.join(tmp, "logs", "teste.log"))
+        try:
+            print(f"\n1. {N_ESCRITORES} threads registrando {N_REGISTROS} mensagens cada...")
+            def escrever(n):
+                for i in range(N_REGISTROS):
+                    log.log(f"escritor {n} mensagem {i}")
+            
+            threads = [threading.Thread(target=escrever, args=(n,))
+                       for n in range(N_ESCRITORES)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            
+            linhas = log.read_logs()
+            for n in range(N_ESCRITORES):
+                prefixo = f"escritor {n} "
+                proprias = [l.split("] ", 1)[1] for l in linhas if prefixo in l]
+                esperadas = [f"{prefixo}mensagem {i}\n" for i in range(N_REGISTROS)]
+                if proprias != esperadas:
+                    print(f"FALHA: Registros do escritor {n} perdidos ou fora de ordem!")
+                    return False
+            print(f"SUCESSO: {len(linhas)} linhas gravadas, em ordem por escritor")
+            
+            print("\n2. Registrando valores inválidos (não-string e surrogate)...")
+            log.log(123)
+            log.log("\ud800")
+            log.log("depois do erro")
+            ultimas = log.read_logs(2)
+            if not log._writer.is_alive() or not ultimas[-1].endswith("depois do erro\n"):
+                print("FALHA: Registro inválido derrubou o logger!")
+                return False
+            print("SUCESSO: Registro inválido descartado, logger segue ativo")
+            
+            print("\n3. Limpando e relendo os logs...")
+            log.clear_logs()
+            if log.read_logs():
+                print("FALHA: Logs não foram limpos!")
+                return False
+            log.log("após limpeza")
+            linhas = log.read_logs()
+            if len(linhas) == 1 and linhas[0].endswith("após limpeza\n"):
+                print("SUCESSO: Arquivo reaberto após a limpeza")
+                return True
+            print("FALHA: Registro após a limpeza não foi gravado!")
+            return False
+        finally:
+            log.close()
+
+def test_outbox():
+    """Testa o envio não-bloqueante para um peer que demora a ler."""
+    print_header("TESTE 7: ENVIO NÃO-BLOQUEANTE (OUTBOX)")
+    import client
+    
+    falhas = []
+    outbox = client.Outbox(on_error=falhas.append)
+    sender, receiver = socket.socketpair()
+    try:
+        outbox.register(sender)
+        
+        print(f"\n1. Enviando {N_QUADROS} quadros sem que o peer leia...")
+        quadros = [i.to_bytes(4, 'big') * 5000 for i in range(N_QUADROS)]
+        for q in quadros:
+            # Se o envio bloqueasse, o teste travaria aqui
+            outbox.send(sender, pack_frame(q))
+        print("SUCESSO: Nenhum envio bloqueou")
+        
+        print("\n2. Lendo os quadros no destino...")
+        receiver.settimeout(10)
+        recebidos = [recv_frame(receiver) for _ in range(N_QUADROS)]
+    finally:
+        outbox.discard(sender)
+        sender.close()
+        receiver.close()
+    
+    if recebidos == quadros and not falhas:
+        print("SUCESSO: Todos os quadros chegaram íntegros e em ordem")
+    else:
+        print("FALHA: Quadros perdidos, corrompidos ou fora de ordem!")
+        return False
+    
+    print("\n3. Enchendo a fila de um peer que parou de ler...")
+    sender, receiver = socket.socketpair()
+    try:
+        outbox.register(sender)
+        quadro = pack_frame(b"x" * 64 * 1024)
+        limite = client.MAX_PENDING_BYTES // len(quadro) + 64
+        try:
+            for _ in range(limite):
+                outbox.send(sender, quadro)
+            print("FALHA: Fila cresceu além de MAX_PENDING_BYTES!")
+            return False
+        except ConnectionError as e:
+            print(f"SUCESSO: Peer descartado ({e})")
+    finally:
+        outbox.discard(sender)
+        sender.close()
+        receiver.close()
+    
+    print("\n4. Descarregando a fila para um peer que não lê...")
+    sender, receiver = socket.socketpair()
+    timeout_original = client.SEND_TIMEOUT
+    client.SEND_TIMEOUT = 0.5
+    try:
+        outbox.register(sender)
+        for _ in range(32):
+            outbox.send(sender, quadro)
+        try:
+            outbox.flush(sender)
+            print("FALHA: flush() concluiu sem o peer ler!")
+            return False
+        except TimeoutError:
+            print("SUCESSO: flush() desistiu após SEND_TIMEOUT")
+            return True
+    finally:
+        client.SEND_TIMEOUT = timeout_original
+        outbox.discard(sender)
+        sender.close()
+        receiver.close()
 
 def run_all_tests():
     """Executa todos os testes."""
@@ -246,6 +473,30 @@ def run_all_tests():
         print(f"\nERRO no teste HMAC Resistance: {e}")
         results.append(("HMAC Resistance", False))
     
+    # Teste 5: Key Exchange Packing
+    try:
+        result5 = test_key_exchange_packing()
+        results.append(("Key Exchange Packing", result5))
+    except Exception as e:
+        print(f"\nERRO no teste Key Exchange Packing: {e}")
+        results.append(("Key Exchange Packing", False))
+    
+    # Teste 6: Logger
+    try:
+        result6 = test_logger()
+        results.append(("Logger", result6))
+    except Exception as e:
+        print(f"\nERRO no teste Logger: {e}")
+        results.append(("Logger", False))
+    
+    # Teste 7: Outbox
+    try:
+        result7 = test_outbox()
+        results.append(("Outbox", result7))
+    except Exception as e:
+        print(f"\nERRO no teste Outbox: {e}")
+        results.append(("Outbox", False))
+    
     # Resumo dos resultados
     print_header("RESUMO DOS TESTES")
     print()
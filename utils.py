@@ -1,80 +1,226 @@
-from socket import *
+from socket import socket, gethostbyname, gethostname, AF_INET, SOCK_DGRAM
 import platform
+import io
+import struct
+from functools import lru_cache
+from threading import Lock
+from time import monotonic
 import subprocess
 import os
+import sys
+
+# Cabeçalho de cada quadro: tamanho do conteúdo (uint32, big-endian)
+FRAME_HEADER = struct.Struct('!I')
+
+# Tamanho máximo aceito para um quadro (1 MiB)
+MAX_FRAME_SIZE = 1024 * 1024
+
+# Sistema operacional, detectado uma única vez
+_SYSTEM = platform.system()
+_IS_WINDOWS = _SYSTEM == 'Windows'
+_IS_LINUX = _SYSTEM == 'Linux'
+
+# Sequência ANSI que limpa a tela e volta o cursor ao início (POSIX)
+_CLEAR_SEQ = '\x1b[2J\x1b[H'
+
+# Validade do IP local em cache, em segundos
+IP_CACHE_TTL = 30
+
+# IP local já descoberto (evita subprocesso/DNS a cada chamada) e o
+# instante (time.monotonic) em que deixa de valer
+_ip_cache = {'ip': None, 'expira': 0.0}
+# Garante uma única consulta em andamento; as demais threads aguardam
+_ip_lock = Lock()
+
+def _get_local_ip() -> str:
+    """
+    Descobre o IP local. O resultado é reaproveitado por IP_CACHE_TTL
+    segundos, de modo que uma troca de rede é percebida logo em seguida.
+    """
+    if monotonic() < _ip_cache['expira']:
+        return _ip_cache['ip']
+    
+    with _ip_lock:
+        if monotonic() >= _ip_cache['expira']:
+            if _IS_LINUX: 
+                ip = get_local_ip_linux()
+            else:
+                ip = gethostbyname(gethostname())
+            _ip_cache['ip'] = ip
+            _ip_cache['expira'] = monotonic() + IP_CACHE_TTL
+        return _ip_cache['ip']
+
+def invalidate_ip_cache():
+    """Descarta o IP em cache (por exemplo, após troca de interface de rede)."""
+    _ip_cache['expira'] = 0.0
 
 def obter_hostname(port: int) -> str:
     """
     Obtém o endereço IP do host local e o combina com a porta fornecida.
     """
-    if platform.system() == 'Linux': 
-        hostname = get_local_ip_linux()
-    elif platform.system() == 'Windows': 
-        hostname = gethostbyname(gethostname())
-    else:
-        hostname = gethostbyname(gethostname())
-    return hostname + f':{port}'
+    return f'{_get_local_ip()}:{port}'
 
+def obter_cn(peer_cert: dict) -> str:
+    """Retorna o commonName do subject de um certificado (getpeercert)."""
+    return next(
+        (value for rdn in peer_cert.get('subject', ()) for key, value in rdn
+         if key == 'commonName'),
+        None
+    )
+
+@lru_cache(maxsize=256)
 def tuple_to_socket(addr: tuple) -> str:
-    """Converte tupla (IP, porta) em string 'IP:porta'."""
+    """
+    Converte tupla (IP, porta) em string 'IP:porta'.
+    Os endereços dos peers se repetem a cada mensagem; o resultado fica em cache.
+    """
     return f'{addr[0]}:{addr[1]}'
 
+@lru_cache(maxsize=256)
 def socket_to_tuple(s: str) -> tuple:
-    """Converte string 'IP:porta' em tupla (IP, porta)."""
-    aux = s.split(':')
-    addr = (aux[0], int(aux[1]))
-    return addr
+    """
+    Converte string 'IP:porta' em tupla (IP, porta).
+    Separa apenas no último ':'. Os sockets do chat são IPv4 (AF_INET).
+    """
+    host, port = s.rsplit(':', 1)
+    return (host, int(port))
+
+def recv_exact(conn, n: int) -> bytes:
+    """
+    Lê exatamente n bytes de um socket.
+    Levanta ConnectionError se a conexão for encerrada antes.
+    """
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = conn.recv_into(view[got:])
+        if not r:
+            raise ConnectionError('Conexão encerrada pelo peer')
+        got += r
+    return bytes(buf)
+
+def pack_frame(payload: bytes) -> bytes:
+    """Prefixa o conteúdo com seu tamanho, formando um quadro."""
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+def send_frame(conn, payload: bytes):
+    """Envia um quadro completo pelo socket."""
+    conn.sendall(pack_frame(payload))
+
+def recv_frame(conn) -> bytes:
+    """
+    Lê exatamente um quadro do socket e retorna seu conteúdo.
+    Levanta ConnectionError se a conexão for encerrada e ValueError se o
+    quadro exceder MAX_FRAME_SIZE.
+    """
+    (size,) = FRAME_HEADER.unpack(recv_exact(conn, FRAME_HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'Quadro de {size} bytes excede o limite')
+    return recv_exact(conn, size)
+
+async def read_frame(reader) -> bytes:
+    """
+    Versão assíncrona de recv_frame para um asyncio.StreamReader.
+    Levanta asyncio.IncompleteReadError se a conexão for encerrada e
+    ValueError se o quadro exceder MAX_FRAME_SIZE.
+    """
+    (size,) = FRAME_HEADER.unpack(await reader.readexactly(FRAME_HEADER.size))
+    if size > MAX_FRAME_SIZE:
+        raise ValueError(f'Quadro de {size} bytes excede o limite')
+    return await reader.readexactly(size)
+
+def peers_to_list(hostname: str, peers: set) -> list:
+    """
+    Converte conjunto de peers em lista de endereços, com o host local
+    primeiro. Permite que quem chama junte tudo uma única vez no final.
+    """
+    return [hostname, *peers]
 
 def peers_to_str(hostname: str, peers: set) -> str:
     """Converte conjunto de peers em string."""
-    r = hostname
-    for p in peers: 
-        r += ' ' + p
-    return r
+    return ' '.join(peers_to_list(hostname, peers))
 
 def get_local_ip_linux() -> str:
-    """Obtém o endereço IP local em sistemas Linux."""
+    """
+    Obtém o endereço IP local em sistemas Linux.
+    Consulta a rota de saída com um socket UDP (nenhum pacote é enviado) e,
+    se não houver rota, recorre à saída do comando `ip addr`.
+    """
+    try:
+        with socket(AF_INET, SOCK_DGRAM) as s:
+            s.connect(("10.255.255.255", 1))
+            ip = s.getsockname()[0]
+        if not ip.startswith("127."):
+            return ip
+    except OSError:
+        pass
+    
     try:
         result = subprocess.run(["ip", "addr"], capture_output=True, text=True)
         if result.returncode == 0:
-            for line in result.stdout.splitlines():
-                if "inet " in line and "127.0.0.1" not in line:
-                    return line.split()[1].split('/')[0]
+            # Percorre a saída linha a linha e para na primeira correspondência
+            for line in io.StringIO(result.stdout):
+                if line.lstrip().startswith("inet ") and "127.0.0.1" not in line:
+                    return line.split(None, 2)[1].split('/', 1)[0]
         return "127.0.0.1"
     except Exception as e:
         print(f"<SISTEMA>: Erro ao obter o IP local: {e}")
         return "127.0.0.1"
 
+# Textos fixos da interface, montados uma única vez
+_SEPARADOR = '=' * 70
+
+_MENU_TEXT = f"""
+{_SEPARADOR}
+COMANDOS DISPONÍVEIS - CHAT P2P SEGURO
+{_SEPARADOR}
+
+CONEXÃO:
+  /connect <IP:PORTA>           → Conecta a um peer (com mTLS)
+  /disconnect <IP:PORTA>        → Desconecta de um peer
+  /peers                        → Lista peers conhecidos
+  /connections                  → Lista conexões ativas
+
+SEGURANÇA:
+  /secure_status                → Status das conexões seguras (DH+HMAC)
+  /security_info                → Informações sobre segurança implementada
+
+SALAS:
+  /create_room <nome> <porta> <senha>  → Cria sala privada
+  /enter_room <nome> [senha]           → Entra em uma sala
+
+USUÁRIO:
+  /resignin                     → Recadastrar usuário
+
+SISTEMA:
+  /clear                        → Limpa a tela
+  /menu                         → Exibe este menu
+{_SEPARADOR}
+
+DICA: Todas as mensagens são protegidas com HMAC-SHA256!
+{_SEPARADOR}
+
+"""
+
+_CLEAR_HEADER = "\n".join([
+    _SEPARADOR,
+    '                    CHAT P2P SEGURO',
+    '                  mTLS + DH + HMAC-SHA256',
+    _SEPARADOR,
+    '                                             Digite /menu para ajuda\n',
+]) + "\n"
+
 def mostrar_comandos():
     """Exibe todos os comandos disponíveis no chat."""
-    print("\n" + "=" * 70)
-    print("COMANDOS DISPONÍVEIS - CHAT P2P SEGURO")
-    print("=" * 70)
-    print("\nCONEXÃO:")
-    print("  /connect <IP:PORTA>           → Conecta a um peer (com mTLS)")
-    print("  /disconnect <IP:PORTA>        → Desconecta de um peer")
-    print("  /peers                        → Lista peers conhecidos")
-    print("  /connections                  → Lista conexões ativas")
-    print("\nSEGURANÇA:")
-    print("  /secure_status                → Status das conexões seguras (DH+HMAC)")
-    print("  /security_info                → Informações sobre segurança implementada")
-    print("\nSALAS:")
-    print("  /create_room <nome> <porta> <senha>  → Cria sala privada")
-    print("  /enter_room <nome> [senha]           → Entra em uma sala")
-    print("\nUSUÁRIO:")
-    print("  /resignin                     → Recadastrar usuário")
-    print("\nSISTEMA:")
-    print("  /clear                        → Limpa a tela")
-    print("  /menu                         → Exibe este menu")
-    print("=" * 70)
-    print("\nDICA: Todas as mensagens são protegidas com HMAC-SHA256!")
-    print("=" * 70 + "\n")
+    sys.stdout.write(_MENU_TEXT)
 
 def clear():
     """Limpa a tela e exibe o cabeçalho."""
-    os.system('cls' if platform.system() == 'Windows' else 'clear')
-    print('=' * 70)
-    print('                    CHAT P2P SEGURO')
-    print('                  mTLS + DH + HMAC-SHA256')
-    print('=' * 70)
-    print('                                             Digite /menu para ajuda\n')
\ No newline at end of file
+    if _IS_WINDOWS:
+        os.system('cls')
+        sys.stdout.write(_CLEAR_HEADER)
+    else:
+        # Escreve a sequência diretamente, sem criar um processo `clear`
+        sys.stdout.write(_CLEAR_SEQ + _CLEAR_HEADER)
+    sys.stdout.flush()
\ No newline at end of file